@@ -1,5 +1,9 @@
 # Package imports
 import warnings
+import asyncio
+import re
+import tempfile
+import httpx
 import streamlit as st
 import os
 from openai import OpenAI
@@ -10,12 +14,11 @@ warnings.filterwarnings("ignore")
 from langchain_openai import ChatOpenAI
 from langchain.memory.summary_buffer import ConversationSummaryBufferMemory
 from langchain_core.prompts.chat import MessagesPlaceholder
+# The pinned langchain already routes straight to the retriever when
+# chat_history is empty, so the first turn never pays the rephrase LLM call
 from langchain.chains import create_history_aware_retriever
 from langchain_core.prompts import ChatPromptTemplate
-from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.messages import HumanMessage
-from langchain_community.retrievers import BM25Retriever
 
 # Import code modules
 from transcribe_voice_openai import *
@@ -35,30 +38,62 @@ voice_dict = {
     'Ocean': 'shimmer'
 }
 
+@st.cache_resource(show_spinner=False)
+def get_http_client():
+    """
+    Build one keep-alive HTTP client shared by every OpenAI-bound object.
+
+    Reusing the pool avoids a fresh TLS handshake to api.openai.com on
+    each Streamlit rerun.
+
+    Output:
+        http_client (httpx.Client): Shared HTTP client with keep-alive pool
+    """
+    return httpx.Client(
+        limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=60)
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_openai_client():
+    """
+    Initialize the OpenAI client once and reuse it across reruns.
+
+    Output:
+        client (OpenAI): Shared OpenAI client
+    """
+    return OpenAI(http_client=get_http_client())
+
+@st.cache_resource(show_spinner=False)
 def initialize_llm(OPENAI_KEY):
     """
     Initialize the language model (LLM).
 
     Input:
         OPENAI_KEY (str): OpenAI API key
-    
+
     Output:
         llm (ChatOpenAI): Initialized ChatOpenAI object
     """
-    return ChatOpenAI(model_name='gpt-4o', temperature=0, openai_api_key=OPENAI_KEY)
+    return ChatOpenAI(model_name='gpt-4o', temperature=0, openai_api_key=OPENAI_KEY,
+                      http_client=get_http_client(), model_kwargs={"seed": 42})
 
 def initialize_memory():
     """
     Initialize the memory buffer for conversation summarization.
-    
+
+    Summarization only triggers once the buffer passes max_token_limit, and
+    runs on a small capped model since it only has to compress overflow.
+
     Output:
         memory (ConversationSummaryBufferMemory): Initialized ConversationSummaryBufferMemory object
     """
-    summarizer_llm = ChatOpenAI(temperature=0, model="gpt-3.5-turbo")  # type: ignore
+    summarizer_llm = ChatOpenAI(temperature=0, model="gpt-4o-mini", max_tokens=256,
+                                http_client=get_http_client())  # type: ignore
     return ConversationSummaryBufferMemory(
         memory_key="chat_history",
         return_messages=True,
         llm=summarizer_llm,
+        max_token_limit=800,
         output_key='answer'
     )
 
@@ -78,14 +113,14 @@ def get_system_prompts():
         """
     )
 
+    # Kept fully static (no {context} interpolation) so the system prefix is
+    # bit-identical across turns and hits OpenAI's prompt cache
     qa_system_prompt = (
-        """You are an AI assistant to help lawyers of all levels practice cross examination. 
+        """You are an AI assistant to help lawyers of all levels practice cross examination.
         Response rules:
         1. You are to respond as the witness
         2. The response should be specific to the question asked. Do not give out information not asked or offer additional information.
-        "\n\n"
-        context: {context}
-        Answer:"""
+        3. Answer using only the deposition context supplied with each question."""
     )
     return contextualize_q_system_prompt, qa_system_prompt
 
@@ -108,11 +143,13 @@ def create_prompts(contextualize_q_system_prompt, qa_system_prompt):
         ]
     )
 
+    # The per-turn context rides in the human message so the cached system
+    # prefix stays constant
     qa_prompt = ChatPromptTemplate.from_messages(
         [
             ("system", qa_system_prompt),
             MessagesPlaceholder("chat_history"),
-            ("human", "{input}"),
+            ("human", "context: {context}\n\n{input}"),
         ]
     )
     return contextualize_q_prompt, qa_prompt
@@ -157,54 +194,145 @@ def initialize_BM25Retriever():
 
         if st.button('Submit'):
             if new_collection_name and uploaded_file is not None:
-                with open(os.path.join(os.getcwd(), new_collection_name + '.pdf'), 'wb') as f:
-                    f.write(uploaded_file.getvalue())
-
-                db, splits = create_new_collection_streamlit(collection_name_str=new_collection_name, 
-                                                             pdf_file=new_collection_name)\
-                                                             
-                return BM25Retriever.from_documents(splits)                                            
+                # Small uploads stay in memory; larger ones go through a
+                # single tempfile instead of a copy dropped into the cwd
+                if uploaded_file.size < 8 * 1024 * 1024:
+                    splits = create_new_collection_streamlit(collection_name_str=new_collection_name,
+                                                             pdf_source=uploaded_file.getvalue())
+                else:
+                    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tf:
+                        tf.write(uploaded_file.getbuffer())
+                        pdf_path = tf.name
+                    try:
+                        splits = create_new_collection_streamlit(collection_name_str=new_collection_name,
+                                                                 pdf_source=pdf_path)
+                    finally:
+                        os.remove(pdf_path)
+
+                return build_retriever(splits, vectors_path=f'data/{new_collection_name}.txt.vectors.npz',
+                                       bm25_path=f'data/{new_collection_name}.txt.bm25.pkl')
     else:
         return load_BM25Retriever(collection_name_str)
 
-def run_chatbot(client, llm, retriever, contextualize_q_prompt, question_answer_chain, voice_key):
+def split_complete_sentences(buffer):
+    """
+    Split a streaming text buffer into completed sentences and a remainder.
+
+    Input:
+        buffer (str): Accumulated text from the token stream
+
+    Output:
+        Tuple (sentences, remainder): Completed sentences ready for TTS and
+        the trailing partial sentence to keep buffering
+    """
+    parts = re.split(r'(?<=[.?!])\s+', buffer)
+    if len(parts) <= 1:
+        return [], buffer
+    return [part for part in parts[:-1] if part.strip()], parts[-1]
+
+async def play_sentences(queue):
+    """
+    Render synthesized sentences in order, one at a time.
+
+    Synthesis tasks run concurrently, but an autoplaying clip rendered the
+    moment its synthesis finishes would start long before the previous
+    sentence stops playing. This worker renders each clip in turn and then
+    waits out its duration before rendering the next.
+
+    Input:
+        queue (asyncio.Queue): (synthesis_task, placeholder) pairs in
+            sentence order, terminated by a None sentinel
+
+    Output:
+        None
+    """
+    while True:
+        item = await queue.get()
+        if item is None:
+            break
+        synthesis, placeholder = item
+        audio_bytes = await synthesis
+        # Streamlit's media endpoint serves the bytes with Range support, so
+        # the browser streams and caches them instead of parsing a data URI
+        placeholder.audio(audio_bytes, format='audio/ogg', autoplay=True)
+        await asyncio.sleep(opus_duration_seconds(audio_bytes))
+
+async def run_chatbot(client, llm, retriever, memory, contextualize_q_prompt, question_answer_chain, voice_key):
     """
     Run the chatbot, handling user input and generating responses.
-    
+
     Input:
         client (OpenAI): OpenAI client
         vectordb (VectorDatabase): Vector database
+        memory (ConversationSummaryBufferMemory): Session-persistent chat memory
         contextualize_q_prompt (ChatPromptTemplate): Prompt for contextualizing questions
         question_answer_chain (DocumentChain): Question-answer chain
         voice_key (str): Selected voice key
-    
+
     Output:
         None
     """
     if retriever is not None:
         # retriever = vectordb.as_retriever()
         history_aware_retriever = create_history_aware_retriever(llm, retriever, contextualize_q_prompt)
-        rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
-        chat_history = []
+
+        # Summarized-and-pruned history from memory, not a fresh empty list
+        chat_history = memory.load_memory_variables({})['chat_history']
 
         # else:
             # audio_bytes = audio_recorder()
-        audio_bytes = audio_recorder(text = 'Ask Question', 
+        audio_bytes = audio_recorder(text = 'Ask Question',
                                             icon_size="4x",
-                                            pause_threshold=2.0, sample_rate=41_000)
-    
+                                            pause_threshold=2.0, sample_rate=48_000)
+
         if audio_bytes:
             st.audio(audio_bytes, format="audio/wav")
 
         # if st.button('Ask Question'):
-            transcript = record_and_transcribe(client, audio_bytes)
+            transcript = await asyncio.to_thread(record_and_transcribe, client, audio_bytes)
             user_input = transcript
 
-            ai_msg_dict = rag_chain.invoke({"input": user_input, "chat_history": chat_history})
-            response = ai_msg_dict["answer"]
-            chat_history.extend([HumanMessage(content=user_input), response])
-
-            create_output_speech(client, response, voice=voice_dict[voice_key])
+            # BM25 scoring is CPU-bound Python; run it in a worker thread so
+            # the event loop stays free for the streaming work below
+            docs = await asyncio.to_thread(
+                history_aware_retriever.invoke,
+                {"input": user_input, "chat_history": chat_history})
+
+            # Stream LLM tokens and fan each completed sentence off to TTS
+            # while the rest of the answer is still being generated
+            response = ""
+            sentence_buffer = ""
+            playback_queue = asyncio.Queue()
+            playback = asyncio.create_task(play_sentences(playback_queue))
+            answer_placeholder = st.empty()
+            async for token in question_answer_chain.astream(
+                    {"input": user_input, "chat_history": chat_history, "context": docs}):
+                if not token:
+                    continue
+                response += token
+                sentence_buffer += token
+                answer_placeholder.markdown(f'**Bot**: {response}')
+                sentences, sentence_buffer = split_complete_sentences(sentence_buffer)
+                for sentence in sentences:
+                    synthesis = asyncio.create_task(asyncio.to_thread(
+                        synthesize_speech, client, sentence, voice_dict[voice_key]))
+                    playback_queue.put_nowait((synthesis, st.empty()))
+
+            # Flush whatever is left after the stream closes
+            if sentence_buffer.strip():
+                synthesis = asyncio.create_task(asyncio.to_thread(
+                    synthesize_speech, client, sentence_buffer.strip(), voice_dict[voice_key]))
+                playback_queue.put_nowait((synthesis, st.empty()))
+
+            playback_queue.put_nowait(None)
+            await playback
+
+            # save_context stores the turn as HumanMessage/AIMessage pairs and
+            # prunes (summarizing) once the buffer passes its token limit
+            memory.save_context({"input": user_input}, {"answer": response})
+
+            # The full history render below includes the final answer
+            answer_placeholder.empty()
 
             conversation_history = st.session_state.get('conversation_history', [])
             conversation_history.append(('You', user_input))
@@ -214,9 +342,6 @@ def run_chatbot(client, llm, retriever, contextualize_q_prompt, question_answer_
             for role, text in conversation_history:
                 st.markdown(f'**{role}**: {text}')
 
-            audio_base64 = convert_audio_to_base64('speech.wav')
-            st.markdown(f'<audio controls autoplay><source src="data:audio/wav;base64,{audio_base64}" type="audio/wav"></audio>', unsafe_allow_html=True)
-
 def main():
     """
     Main function to run the Streamlit app.
@@ -246,10 +371,14 @@ def main():
 
     # audio_bytes = audio_recorder(pause_threshold=2.0, sample_rate=41_000)
 
-    client = OpenAI()
+    client = get_openai_client()
 
     llm = initialize_llm(OPENAI_KEY = os.environ["OPENAI_API_KEY"])
-    memory = initialize_memory()
+
+    # Memory lives in session_state so the conversation survives reruns
+    if 'memory' not in st.session_state:
+        st.session_state['memory'] = initialize_memory()
+    memory = st.session_state['memory']
 
     contextualize_q_system_prompt, qa_system_prompt = get_system_prompts()
     contextualize_q_prompt, qa_prompt = create_prompts(contextualize_q_system_prompt, qa_system_prompt)
@@ -259,7 +388,7 @@ def main():
     # vectordb = initialize_vectordb()
     retriever = initialize_BM25Retriever()
 
-    run_chatbot(client, llm, retriever, contextualize_q_prompt, question_answer_chain, voice_key)
+    asyncio.run(run_chatbot(client, llm, retriever, memory, contextualize_q_prompt, question_answer_chain, voice_key))
 
 if __name__ == '__main__':
     main()
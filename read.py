@@ -56,6 +56,41 @@ def clean_ocr_using_llm(raw_text):
     return response.choices[0].message.content
 
 
+def read_pages(file, method='pytesseract'):
+    """
+    Extract text from a PDF one page at a time.
+
+    Input:
+        file (str or bytes): PDF file path, or the raw PDF bytes held in memory
+        method (str): OCR method ('pytesseract' or 'easyocr'), default is 'pytesseract'
+
+    Output:
+        Generator yielding the OCR text of each page as a string
+    """
+    if isinstance(file, (bytes, bytearray)):
+        doc = fitz.open(stream=file, filetype='pdf')
+    else:
+        doc = fitz.open(file)
+
+    with doc:
+        for page in doc:
+            # Extract text from the PDF page
+            pix = page.get_pixmap(dpi=200)
+
+            if method == 'pytesseract':
+                # Use Pytesseract for OCR
+                text = pytesseract.image_to_string(
+                    pix_to_image(pix), config=r"--psm 6"
+                )
+            else:
+                # Use EasyOCR for OCR
+                easyocr_output_dict = reader.readtext(pix_to_image(pix), paragraph=False)
+                for source, text_extract, confidence in easyocr_output_dict:
+                    text = "\n".join([text_extract])
+
+            yield text
+
+
 def read(files, method='pytesseract'):
     """
     Extract text from PDF files using OCR methods.
@@ -73,31 +108,9 @@ def read(files, method='pytesseract'):
         text_dict[file] = {}
 
         # Process each page in the PDF document
-        with fitz.open(file) as doc:
-            number_pages = 0
-            for page in doc:
-                # Extract text from the PDF page
-                pix = page.get_pixmap(dpi=200)
-
-                if method == 'pytesseract':
-                    # Use Pytesseract for OCR
-                    text = pytesseract.image_to_string(
-                        pix_to_image(pix), config=r"--psm 6"
-                    )
-                else:
-                    # Use EasyOCR for OCR
-                    easyocr_output_dict = reader.readtext(pix_to_image(pix), paragraph=False)
-                    for source, text_extract, confidence in easyocr_output_dict:
-                        text = "\n".join([text_extract])
-
-                # Split text into lines
-                lines_page = text.split("\n")
-                text_dict[file][number_pages] = lines_page
-                number_pages += 1
-
-                # break for testing
-                # if number_pages == 10:
-                #     break
+        for number_pages, text in enumerate(read_pages(file, method=method)):
+            # Split text into lines
+            text_dict[file][number_pages] = text.split("\n")
 
         # Write extracted text to a text file
         with open(f"{file.split('.')[0]}.txt", "w") as f:
@@ -1,83 +1,134 @@
 # package imports
-import tempfile
-import base64
+import io
+import struct
+import wave
 import streamlit as st
+import webrtcvad
 import os
 
 os.environ["OPENAI_API_KEY"] = st.secrets["OPENAI_KEY"]
 
 
+def trim_trailing_silence(audio_bytes, aggressiveness=2, frame_ms=20):
+    """
+    Drop trailing silence from a WAV recording before it is uploaded.
+
+    The recorder's pause threshold leaves up to 2 s of silence at the end
+    of every submission, which Whisper still has to ingest. Scan 20 ms
+    frames with webrtcvad and cut after the last voiced frame, keeping a
+    300 ms tail so the final word isn't clipped.
+
+    Input:
+        audio_bytes (bytes): WAV bytes captured by the audio recorder
+        aggressiveness (int): webrtcvad mode, 0 (lenient) to 3 (strict)
+        frame_ms (int): VAD frame length in milliseconds
+
+    Output:
+        trimmed (bytes): WAV bytes ending shortly after the last speech,
+        or the original bytes if the recording can't be analyzed
+    """
+    try:
+        with wave.open(io.BytesIO(audio_bytes), 'rb') as wav:
+            channels = wav.getnchannels()
+            sample_width = wav.getsampwidth()
+            sample_rate = wav.getframerate()
+            # webrtcvad only handles 16-bit mono at 8/16/32/48 kHz
+            if channels != 1 or sample_width != 2 or sample_rate not in (8000, 16000, 32000, 48000):
+                return audio_bytes
+            pcm = wav.readframes(wav.getnframes())
+
+        vad = webrtcvad.Vad(aggressiveness)
+        frame_bytes = int(sample_rate * frame_ms / 1000) * sample_width
+        last_voiced_end = 0
+        for offset in range(0, len(pcm) - frame_bytes + 1, frame_bytes):
+            if vad.is_speech(pcm[offset:offset + frame_bytes], sample_rate):
+                last_voiced_end = offset + frame_bytes
+
+        if last_voiced_end == 0:
+            return audio_bytes
+
+        keep = min(len(pcm), last_voiced_end + int(sample_rate * 0.3) * sample_width)
+        trimmed = io.BytesIO()
+        with wave.open(trimmed, 'wb') as out:
+            out.setnchannels(channels)
+            out.setsampwidth(sample_width)
+            out.setframerate(sample_rate)
+            out.writeframes(pcm[:keep])
+        return trimmed.getvalue()
+    except (wave.Error, EOFError):
+        return audio_bytes
+
+
 def record_and_transcribe(client, audio_bytes):
+    """
+    Transcribe recorded audio directly from memory.
+
+    Input:
+        client (OpenAI): OpenAI client
+        audio_bytes (bytes): WAV bytes captured by the audio recorder
+
+    Output:
+        transcript (str): Transcribed text
+    """
+    # Cut trailing silence so it isn't uploaded, billed, or transcribed
+    audio_bytes = trim_trailing_silence(audio_bytes)
+
+    # Upload straight from memory - no temp file on disk. Streaming
+    # transcription needs an openai SDK newer than the pinned 1.25.1, so
+    # stay on the plain whisper-1 call until the pin can move.
+    audio_file = ("question.wav", io.BytesIO(audio_bytes))
 
-    # save recording
-    filename = "Question.wav"
-    with open(filename, "wb") as f:
-        f.write(audio_bytes)
-
-    # Pass the audio file to the model for transcription
-    with open(filename, "rb") as audio_file:
-        transcript = client.audio.transcriptions.create(
-            file=audio_file,
-            model="whisper-1",
-            response_format="text",
-            language="en"
-        )
-    
-    # Ensure the file is deleted
-    if os.path.exists(filename):
-        os.remove(filename)
+    transcript = client.audio.transcriptions.create(
+        file=audio_file,
+        model="whisper-1",
+        response_format="text",
+        language="en"
+    )
 
     return transcript
 
-# def record_and_transcribe(client, audio_bytes):
-#     # Create a temporary file
-#     with tempfile.NamedTemporaryFile(delete=True, suffix=".wav") as temp_audio_file:
-#         # Write the audio bytes to the temporary file
-#         temp_audio_file.write(audio_bytes)
-#         temp_audio_file.flush()  # Ensure the data is written
 
-#         # Pass the temporary file to the model for transcription
-#         transcript = client.audio.transcriptions.create(
-#             file=temp_audio_file,
-#             model="whisper-1",
-#             response_format="text",
-#             language="en"
-#         )
+def opus_duration_seconds(audio_bytes):
+    """
+    Estimate the duration of an Ogg Opus clip.
+
+    The granule position of the last Ogg page counts samples at Opus's
+    fixed 48 kHz rate, so duration falls out of the final page header.
 
-#     return transcript
+    Args:
+        audio_bytes (bytes): Ogg Opus data
 
+    Returns:
+        float: Clip duration in seconds, 0.0 if it can't be determined
+    """
+    index = audio_bytes.rfind(b'OggS')
+    if index == -1 or len(audio_bytes) < index + 14:
+        return 0.0
+    granule = struct.unpack_from('<q', audio_bytes, index + 6)[0]
+    return max(granule, 0) / 48000.0
 
 
-def create_output_speech(client, response_text, voice="alloy"):
+def synthesize_speech(client, text, voice="alloy"):
     """
-    Create a speech output from text using TTS model and save as WAV file.
+    Synthesize speech for a piece of text and return the audio bytes.
 
     Args:
         client: API client for audio processing
-        response_text (str): Text to be converted to speech
+        text (str): Text to be converted to speech
         voice (str): Voice style for the speech, default is "alloy"
 
     Returns:
-        None
+        bytes: Synthesized audio
     """
+    buffer = io.BytesIO()
+    # Opus starts decoding on far smaller chunks than WAV, so playback of a
+    # sentence can begin while later sentences are still being synthesized
     with client.audio.speech.with_streaming_response.create(
             model="tts-1",
             voice=voice,
-            input=response_text,
+            input=text,
+            response_format="opus",
     ) as response:
-        response.stream_to_file("speech.wav")
-    return
-
-def convert_audio_to_base64(audio_file_path):
-    """
-    Convert an audio file to base64 encoding.
-
-    Args:
-        audio_file_path (str): Path to the audio file
-
-    Returns:
-        str: Base64 encoded string of the audio file
-    """
-    with open(audio_file_path, 'rb') as f:
-        audio_encoded = base64.b64encode(f.read()).decode('utf-8')
-    return audio_encoded
\ No newline at end of file
+        for chunk in response.iter_bytes():
+            buffer.write(chunk)
+    return buffer.getvalue()
@@ -1,48 +1,342 @@
 # Package imports
+import hashlib
+import os
+import pickle
+import re
+from typing import Any, List
+
+import bm25s
+import numpy as np
+import streamlit as st
+from langchain.retrievers import EnsembleRetriever
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import TextLoader
 from langchain_community.embeddings.sentence_transformer import SentenceTransformerEmbeddings
-from langchain_community.retrievers import BM25Retriever
+from langchain_community.vectorstores import FAISS
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 
 # Import the read module
-from read import read
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# Initialize the text splitter
-text_splitter = RecursiveCharacterTextSplitter(
-    separators=["\n\n"],
-    chunk_size=1250,
-    chunk_overlap=250
-)
+from read import read, read_pages
 
-# Initialize SentenceTransformer embeddings
-embedding_function = SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
 
+# Compiled once at import; findall runs entirely in the C regex engine
+TOKEN_RE = re.compile(r"\w+")
 
-def create_new_collection_streamlit(collection_name_str=None, pdf_file=None):
 
-     # Convert PDF to text
-    read([f'{pdf_file}.pdf'])
+def tokenize(text):
+    """
+    Tokenize text for BM25 with the pre-compiled word regex.
 
+    Input:
+        text (str): Raw text
+
+    Output:
+        tokens (list): Lowercased word tokens
+    """
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25SRetriever(BaseRetriever):
+    """
+    BM25 retriever backed by bm25s.
+
+    bm25s keeps the index in a scipy sparse matrix and scores a query with a
+    single matrix-vector product in C, instead of rank_bm25's per-document
+    Python loops, so retrieval cost no longer grows with interpreted work.
+    """
+
+    index: Any
+    docs: List[Document]
+    k: int = 4
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @classmethod
+    def from_documents(cls, documents, k=4):
+        """
+        Build a bm25s index over the given documents.
+
+        Input:
+            documents (list): Split Document chunks to index
+            k (int): Number of documents to return per query
+
+        Output:
+            retriever (BM25SRetriever): Retriever over the indexed chunks
+        """
+        corpus_tokens = [tokenize(doc.page_content) for doc in documents]
+        index = bm25s.BM25()
+        index.index(corpus_tokens, show_progress=False)
+        return cls(index=index, docs=list(documents), k=k)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        doc_ids, _scores = self.index.retrieve(
+            [tokenize(query)], k=min(self.k, len(self.docs)), show_progress=False
+        )
+        return [self.docs[i] for i in doc_ids[0]]
+
+
+@st.cache_resource(show_spinner=False)
+def get_text_splitter():
+    """
+    Build the text splitter once and reuse it across Streamlit reruns.
+
+    Output:
+        text_splitter (RecursiveCharacterTextSplitter): Shared splitter instance
+    """
+    # Every OCR'd line carries a leading transcript line number, so speaker
+    # turns look like "12 Q. Good morning" (Sample1) or "13 The Witness. /
+    # "11 Mr. Greim." (Sample2) - literal "\nQ." never matches. Match the
+    # numbered speaker lines with regexes, then fall back to blank lines,
+    # newlines and sentence ends.
+    return RecursiveCharacterTextSplitter(
+        separators=[
+            r"\n\d+\s+Q\.\s",
+            r"\n\d+\s+A\.\s",
+            r"\n\d+\s+The Witness\.\s",
+            r"\n\d+\s+(?:Mr|Ms)\.\s",
+            r"\n\n",
+            r"\n",
+            r"\. ",
+        ],
+        chunk_size=2000,
+        chunk_overlap=150,
+        is_separator_regex=True
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_embedding_function():
+    """
+    Load the SentenceTransformer embeddings once and reuse them across reruns.
+
+    Output:
+        embedding_function (SentenceTransformerEmbeddings): Shared embeddings instance
+    """
+    return SentenceTransformerEmbeddings(
+        model_name="all-MiniLM-L6-v2",
+        encode_kwargs={'batch_size': 64}
+    )
+
+
+def _splitter_cache_key():
+    """
+    Hash the splitter parameters so cached chunks invalidate when they change.
+
+    Output:
+        key (str): Hex digest of (chunk_size, chunk_overlap, separators)
+    """
+    splitter = get_text_splitter()
+    params = (splitter._chunk_size, splitter._chunk_overlap, splitter._separators)
+    return hashlib.sha1(repr(params).encode('utf-8')).hexdigest()
+
+
+def load_cached_splits(cache_path, text=None):
+    """
+    Load previously split chunks from disk if they are still valid.
+
+    Input:
+        cache_path (str): Path of the .chunks.pkl file next to the .txt
+        text (str or None): Source text; when given, the cache only hits if
+            the text is unchanged since the chunks were saved
+
+    Output:
+        splits (list or None): Cached Document chunks, or None on miss
+    """
+    if not os.path.exists(cache_path):
+        return None
+    with open(cache_path, 'rb') as f:
+        payload = pickle.load(f)
+    if payload.get('key') != _splitter_cache_key():
+        return None
+    if text is not None and payload.get('text_sha1') != hashlib.sha1(text.encode('utf-8')).hexdigest():
+        return None
+    return payload['splits']
+
+
+def save_cached_splits(cache_path, splits, text=None):
+    """
+    Persist split chunks to disk keyed on splitter params and source text.
+
+    Input:
+        cache_path (str): Path of the .chunks.pkl file next to the .txt
+        splits (list): Document chunks produced by the splitter
+        text (str or None): Source text the chunks were split from
+
+    Output:
+        None
+    """
+    payload = {'key': _splitter_cache_key(), 'splits': splits}
+    if text is not None:
+        payload['text_sha1'] = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    with open(cache_path, 'wb') as f:
+        pickle.dump(payload, f)
 
-    # Load the document and split it into chunks
-    loader = TextLoader(f'{pdf_file}.txt')
-    documents = loader.load()
 
-    # Apply the text splitter to the documents
-    splits = text_splitter.split_documents(documents)
+def create_new_collection_streamlit(collection_name_str=None, pdf_source=None):
+
+    splitter = get_text_splitter()
+    progress = st.progress(0.0, text='Reading PDF')
+
+    # Split each page in a worker thread as soon as its OCR finishes, so
+    # splitting earlier pages overlaps OCR of later ones
+    page_texts = {}
+    futures = {}
+    with ThreadPoolExecutor() as executor:
+        for page_number, page_text in enumerate(read_pages(pdf_source)):
+            page_texts[page_number] = page_text
+            futures[executor.submit(splitter.split_text, page_text)] = page_number
+
+        chunks_by_page = {}
+        for done, future in enumerate(as_completed(futures), start=1):
+            chunks_by_page[futures[future]] = future.result()
+            progress.progress(done / len(futures), text=f'Splitting page {done}/{len(futures)}')
+
+    # Write the extracted text into data/ so the collection shows up in the
+    # selectbox and can be reloaded later
+    txt_path = os.path.join('data', f'{collection_name_str}.txt')
+    full_text = ''.join(page_texts[page_number] + "\n" for page_number in sorted(page_texts))
+    with open(txt_path, 'w') as f:
+        f.write(full_text)
+
+    # Reassemble chunks in page order as Documents
+    splits = [
+        Document(page_content=chunk, metadata={'source': txt_path, 'page': page_number})
+        for page_number in sorted(chunks_by_page)
+        for chunk in chunks_by_page[page_number]
+    ]
+
+    progress.empty()
+
+    # Persist the chunks so reloading this collection skips re-splitting
+    save_cached_splits(f'{txt_path}.chunks.pkl', splits, text=full_text)
 
     return splits
 
 
-def load_BM25Retriever(filepath):
+def _load_bm25_retriever(bm25_path, corpus_sha1):
+    """
+    Reconstruct a persisted BM25SRetriever if its cache is still valid.
+
+    Input:
+        bm25_path (str): Path of the .bm25.pkl file next to the .txt
+        corpus_sha1 (str): Hash of the current chunk texts; the cache only
+            hits if it was built from the same corpus
+
+    Output:
+        retriever (BM25SRetriever or None): Rebuilt retriever, or None on miss
+    """
+    if not os.path.exists(bm25_path):
+        return None
+    with open(bm25_path, 'rb') as f:
+        payload = pickle.load(f)
+    if payload.get('key') != _splitter_cache_key():
+        return None
+    if payload.get('corpus_sha1') != corpus_sha1:
+        return None
+    return BM25SRetriever(index=payload['index'], docs=payload['docs'])
+
+
+def _save_bm25_retriever(bm25_path, retriever, corpus_sha1):
+    """
+    Persist a fitted BM25SRetriever so later loads skip re-indexing.
+
+    Input:
+        bm25_path (str): Path of the .bm25.pkl file next to the .txt
+        retriever (BM25SRetriever): Fitted retriever to persist
+        corpus_sha1 (str): Hash of the chunk texts the index was built from
+
+    Output:
+        None
+    """
+    with open(bm25_path, 'wb') as f:
+        pickle.dump({'key': _splitter_cache_key(), 'corpus_sha1': corpus_sha1,
+                     'index': retriever.index, 'docs': retriever.docs}, f)
+
 
+def build_retriever(splits, vectors_path=None, bm25_path=None):
+    """
+    Build an ensemble retriever (BM25 + dense FAISS) over split chunks.
+
+    The chunks are embedded in a single batched embed_documents call so
+    SBERT runs one large matmul per batch instead of per-document calls,
+    and both the embedding matrix and the fitted BM25 index are persisted
+    so later loads deserialize instead of rebuilding.
+
+    Input:
+        splits (list): Document chunks to index
+        vectors_path (str or None): Where to persist/load the embedding matrix
+        bm25_path (str or None): Where to persist/load the fitted BM25 index
+
+    Output:
+        retriever (EnsembleRetriever): Combined sparse + dense retriever
+    """
+    texts = [doc.page_content for doc in splits]
+    metadatas = [doc.metadata for doc in splits]
+    embedding_function = get_embedding_function()
+
+    # Both persisted payloads are keyed on this, so re-creating a collection
+    # under an existing name invalidates its stale caches
+    corpus_sha1 = hashlib.sha1(''.join(texts).encode('utf-8')).hexdigest()
+
+    vectors = None
+    if vectors_path is not None and os.path.exists(vectors_path):
+        with np.load(vectors_path) as cached:
+            if str(cached['corpus_sha1']) == corpus_sha1 and len(cached['vectors']) == len(texts):
+                vectors = cached['vectors']
+
+    if vectors is None:
+        # One batched call over the whole corpus
+        vectors = np.asarray(embedding_function.embed_documents(texts), dtype=np.float32)
+        if vectors_path is not None:
+            np.savez(vectors_path, vectors=vectors, corpus_sha1=corpus_sha1)
+
+    # Guard against ever zipping mismatched vectors and texts: zip would
+    # silently truncate and FAISS would serve wrong embeddings
+    assert len(vectors) == len(texts)
+
+    faiss_store = FAISS.from_embeddings(
+        list(zip(texts, vectors.tolist())), embedding_function, metadatas=metadatas
+    )
+
+    bm25_retriever = _load_bm25_retriever(bm25_path, corpus_sha1) if bm25_path is not None else None
+    if bm25_retriever is None:
+        bm25_retriever = BM25SRetriever.from_documents(splits)
+        if bm25_path is not None:
+            _save_bm25_retriever(bm25_path, bm25_retriever, corpus_sha1)
+
+    return EnsembleRetriever(
+        retrievers=[
+            bm25_retriever,
+            faiss_store.as_retriever(search_kwargs={'k': 4}),
+        ],
+        weights=[0.5, 0.5],
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def load_BM25Retriever(filepath):
 
     # Load the document and split it into chunks
     # loader = TextLoader(f'{filepath}.txt')
     loader = TextLoader(f"data/{filepath}")
     documents = loader.load()
+    text = ''.join(doc.page_content for doc in documents)
+
+    # Reuse chunks split on a previous run when text and params match
+    cache_path = f"data/{filepath}.chunks.pkl"
+    splits = load_cached_splits(cache_path, text=text)
 
-    # Apply the text splitter to the documents
-    splits = text_splitter.split_documents(documents)
+    if splits is None:
+        # Apply the text splitter to the documents
+        splits = get_text_splitter().split_documents(documents)
+        save_cached_splits(cache_path, splits, text=text)
 
-    return BM25Retriever.from_documents(splits)   
\ No newline at end of file
+    return build_retriever(splits, vectors_path=f"data/{filepath}.vectors.npz",
+                           bm25_path=f"data/{filepath}.bm25.pkl")
\ No newline at end of file